@@ -1,5 +1,6 @@
 from datetime import datetime
 from dataclasses import dataclass
+from collections import namedtuple
 
 
 @dataclass
@@ -15,3 +16,7 @@ class FeedEntry:
     summary: str
     summary_tokens: int
 
+
+# Slim projection for NER, which only needs the id, link and description
+FeedEntryLite = namedtuple('FeedEntryLite', ['id', 'link', 'description'])
+
@@ -1,5 +1,6 @@
-import json
 import nltk
+import orjson
+import functools
 import openai
 import logging
 import asyncio
@@ -12,6 +13,18 @@ from datetime import datetime
 from asyncio import Semaphore
 from bs4 import BeautifulSoup
 from rss_loader.feed_entry import FeedEntry
+from tenacity import AsyncRetrying, before_sleep_log, retry_if_exception_type, stop_after_attempt, wait_random_exponential
+
+
+@functools.lru_cache(maxsize=None)
+def _get_encoder(model: str):
+    """Return the tiktoken encoder for a model, shared across instances."""
+    return tiktoken.encoding_for_model(model)
+
+
+def _extract_text(html: str) -> str:
+    """Strip markup from description HTML and return the plain text."""
+    return BeautifulSoup(html, features="lxml").get_text()
 
 
 class FeedProcessor:
@@ -29,31 +42,31 @@ class FeedProcessor:
         self.max_delay: int = kwargs.get("max_delay", 10)
         self.concurrency_limit: int = kwargs.get("concurrency_limit", 3)
         self.semaphore: Semaphore = asyncio.Semaphore(self.concurrency_limit)
-        self.encoder = tiktoken.encoding_for_model('gpt-4')
+        self.encoder = _get_encoder('gpt-4')
 
-    def __exponential_backoff(self, delay):
-        asyncio.sleep(min(2 * delay, self.max_delay))
-
-    def _chat_one_shot(self, prompt: str, user_content: str, model_name: str, max_tokens=0):
-        delay = 1  # Initial delay between retries
+    async def _achat_one_shot(self, prompt: str, user_content: str, model_name: str, max_tokens=0):
         messages = [
             {"role": "system", "content": prompt},
             {"role": "user", "content": user_content},
         ]
 
-        while True:
+        opts = {"model": model_name, "temperature": self.temperature, "messages": messages}
+        if max_tokens > 0:
+            opts['max_tokens'] = max_tokens
+
+        async with self.semaphore:
             try:
-                if max_tokens > 0:
-                    response = openai.ChatCompletion.create(model=model_name, temperature=self.temperature, messages=messages, max_tokens=max_tokens)
-                else:
-                    response = openai.ChatCompletion.create(model=model_name, temperature=self.temperature, messages=messages)
-                response_message = response["choices"][0]["message"]
-                return response_message["content"].strip(), response['usage']['completion_tokens']
-
-            except openai.error.OpenAIError as e:
-                logging.exception("OpenAIError occurred: %s", e)
-                self.__exponential_backoff(delay)
-                delay *= 2
+                # Random-exponential waits desynchronize retries across the
+                # gathered tasks so they don't hammer the API in lock-step
+                async for attempt in AsyncRetrying(wait=wait_random_exponential(min=1, max=self.max_delay),
+                                                   stop=stop_after_attempt(6),
+                                                   retry=retry_if_exception_type(openai.error.OpenAIError),
+                                                   before_sleep=before_sleep_log(logging.getLogger(__name__), logging.WARNING),
+                                                   reraise=True):
+                    with attempt:
+                        response = await openai.ChatCompletion.acreate(**opts)
+                        response_message = response["choices"][0]["message"]
+                        return response_message["content"].strip(), response['usage']['completion_tokens']
             except Exception as e:
                 logging.exception("Error occurred during chat completion: %s", e)
                 raise
@@ -67,100 +80,152 @@ class FeedProcessor:
         Raises:
             Exception: If an error occurs when fetching or parsing the feed.
         """
+        asyncio.run(self.parse_feeds([url]))
+
+    async def parse_feeds(self, urls: list) -> None:
+        """Fetch and parse several RSS feeds concurrently and add new entries to the database.
+
+        feedparser.parse is blocking I/O, so each fetch is pushed onto a worker
+        thread and the results are gathered together.
+
+        Args:
+            urls: The URLs of the RSS feeds to parse.
+
+        Raises:
+            Exception: If an error occurs when fetching or parsing a feed.
+        """
         try:
-            feed = feedparser.parse(url)
-            for entry in feed.entries:
-                self.add_entry(entry)
+            # Pass the stored ETag / Last-Modified values so unchanged feeds
+            # come back as a 304 with no body to re-process
+            states = [self.db.get_feed_state(url) for url in urls]
+            feeds = await asyncio.gather(*(asyncio.to_thread(feedparser.parse, url, etag=etag, modified=modified)
+                                           for url, (etag, modified) in zip(urls, states)))
+            for url, feed in zip(urls, feeds):
+                if feed.get('status') == 304:
+                    print(f"Skipping {url} as it is unchanged...")
+                    continue
+
+                # Batch-encode every description in one call rather than hitting the
+                # tokenizer once per entry
+                descriptions = [entry.description for entry in feed.entries]
+                desc_token_counts = [len(ids) for ids in self.encoder.encode_batch(descriptions)]
+                for entry, desc_tokens in zip(feed.entries, desc_token_counts):
+                    self.add_entry(entry, desc_tokens)
+
+                self.db.set_feed_state(url, feed.get('etag'), feed.get('modified'))
+
+            # Commit all new entries as a single transaction rather than
+            # fsyncing once per entry
+            self.db.commit()
 
-            self.update_summaries()
-            self.ner_extraction()
+            await self.update_summaries()
+            await self.ner_extraction()
         except Exception as e:
             print(f"An error occurred when parsing the feed: {e}")
             raise e
 
-    def add_entry(self, entry: feedparser.FeedParserDict) -> None:
+    def add_entry(self, entry: feedparser.FeedParserDict, desc_tokens: int) -> None:
         """Add an entry to the database if it does not already exist.
 
         Args:
             entry: The entry to add.
+            desc_tokens: The precomputed token count for the entry description.
 
         Raises:
             ValueError: If an error occurs when parsing the date.
         """
-        if self.db.have_link(entry.link):
-            print(f"Skipping {entry.link} as it already exists...")
-            return
-
-        print(f"Adding {entry.link}")
-        dc_subject = None
-        if 'tags' in entry:
-            dc_subject = ', '.join([tag.term for tag in entry.tags])
+        dc_subject = ', '.join(tag.term for tag in entry.tags) if 'tags' in entry else None
 
-        desc_tokens = len(self.encoder.encode(entry.description))
         try:
             pub_date = parser.parse(entry.published)
         except ValueError:
             print("An error occurred when parsing the date. Using the current date and time instead.")
             pub_date = datetime.now()
 
+        # INSERT OR IGNORE against the unique link index replaces the separate
+        # exists query, so new entries cost one round-trip instead of two
         entry_id = self.db.add_entry(entry.title, entry.link, pub_date, entry.description, dc_subject, entry.author, desc_tokens)
+        if entry_id is None:
+            print(f"Skipping {entry.link} as it already exists...")
+            return
 
-        soup = BeautifulSoup(entry.description, 'html.parser')
+        print(f"Adding {entry.link}")
+        soup = BeautifulSoup(entry.description, 'lxml')
+        links = []
+        bios = []
         for a in soup.find_all('a', href=True):
             if 'name' in a.get('class', []):
-                self.db.add_related_bio(entry_id, a.text, a['href'])
+                bios.append((entry_id, a.text, a['href']))
             else:
-                self.db.add_related_link(entry_id, a['href'])
+                links.append((entry_id, a['href']))
 
-        self.db.commit()
+        self.db.add_related_links(links)
+        self.db.add_related_bios(bios)
 
-    def update_summaries(self):
+    async def update_summaries(self):
         entries = self.db.entries_needing_summaries()
 
-        for entry in entries:
-            entry.summary, entry.summary_tokens = self.summarize(entry)
+        tasks = [self.summarize(entry) for entry in entries]
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+
+        for entry, result in zip(entries, results):
+            if isinstance(result, Exception):
+                print(f"An error occurred while summarizing {entry.link}: {result}")
+                continue
+
+            entry.summary, entry.summary_tokens = result
             self.db.update_summary(entry)
             self.db.commit()
 
-    def summarize(self, entry: FeedEntry):
+    async def summarize(self, entry: FeedEntry):
         print(f"Summarizing {entry.link}")
-        soup = BeautifulSoup(entry.description, features="html.parser")
-        description_text = soup.get_text()
+
+        # Parse on a worker thread so CPU-bound HTML parsing doesn't stall the
+        # event loop while other entries are in flight
+        description_text = await asyncio.to_thread(_extract_text, entry.description)
 
         prompt = 'Produce a concise summary of the news article in the user message.'
-        return self._chat_one_shot(prompt, description_text, self.model_name)
+        return await self._achat_one_shot(prompt, description_text, self.model_name)
 
-    def ner_extraction(self):
+    async def ner_extraction(self):
         entries = self.db.entries_without_ner()
-        for entry in entries:
 
-            ner_data = self.perform_ner(entry)
+        tasks = [self.perform_ner(entry) for entry in entries]
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+
+        for entry, ner_data in zip(entries, results):
+            if isinstance(ner_data, Exception):
+                print(f"An error occurred while extracting entities from {entry.link}: {ner_data}")
+                continue
 
             for ner in ner_data:
                 self.db.add_ner(entry, ner['type'], ner['entity'])
 
             self.db.commit()
 
-    def perform_ner(self, entry):
-        soup = BeautifulSoup(entry.description, features="html.parser")
-        description_text = soup.get_text()
+    async def perform_ner(self, entry):
+        description_text = await asyncio.to_thread(_extract_text, entry.description)
         chunks = self.split_text_for_ner(description_text, 4000)
+
+        # The chunks are independent, so run them concurrently under the
+        # semaphore instead of one round-trip at a time
+        print(f"Running NER on {entry.link} across {len(chunks)} chunks.")
+        chunk_results = await asyncio.gather(*(self.perform_ner_chunk(chunk) for chunk in chunks), return_exceptions=True)
+
         entities = []
-        chunk_no = 1
-        for chunk in chunks:
-            print(f"Running NER on {entry.link}.  Chunk {chunk_no} of {len(chunks)}.")
-            chunk_no = chunk_no + 1
-            entities.extend(self.perform_ner_chunk(chunk))
+        for chunk_no, result in enumerate(chunk_results, start=1):
+            if isinstance(result, Exception):
+                print(f"An error occurred in chunk {chunk_no} of {entry.link}: {result}")
+                continue
 
-        unique_entities = set()  # Create an empty set to store unique entities
-        no_duplicates = []  # Array to store dicts with no duplicate entities
+            entities.extend(result)
 
+        # Keep the first occurrence of each entity; dicts preserve insertion order
+        seen = {}
         for dict_ in entities:
-            if dict_["entity"] not in unique_entities:  # Check if entity is unique
-                no_duplicates.append(dict_)  # If it is, add dict to no_duplicates
-                unique_entities.add(dict_["entity"])  # And add entity to unique_entities
+            seen.setdefault(dict_["entity"], dict_)
 
-        return no_duplicates
+        return list(seen.values())
 
 
 
@@ -168,49 +233,55 @@ class FeedProcessor:
         # Split text into paragraphs
         paragraphs = nltk.tokenize.blankline_tokenize(text)
 
+        # Tokenize all paragraphs in a single batched call
+        token_counts = [len(ids) for ids in self.encoder.encode_batch(paragraphs)]
+
         # Array to hold result
         result = []
 
-        # Temporary variable to hold paragraphs
-        temp_paragraphs = ""
-
-        for paragraph in paragraphs:
-            # Calculate tokens in the current paragraph
-            tokens = len(self.encoder.encode(paragraph))
+        # Temporary variable to hold paragraphs, with a running token count so we
+        # never re-encode the buffer
+        temp_paragraphs = []
+        temp_tokens = 0
 
+        for paragraph, tokens in zip(paragraphs, token_counts):
             # If tokens in the current paragraph and the temporary paragraphs exceed the limit
             # add the temporary paragraphs to the result and start a new temporary paragraphs
-            if tokens + len(self.encoder.encode(temp_paragraphs)) > token_limit:
-                result.append(temp_paragraphs.strip())
-                temp_paragraphs = paragraph
+            if tokens + temp_tokens > token_limit:
+                result.append('\n'.join(temp_paragraphs).strip())
+                temp_paragraphs = [paragraph]
+                temp_tokens = tokens
             else:
                 # Otherwise, add the current paragraph to the temporary paragraphs
-                temp_paragraphs += "\n" + paragraph
+                temp_paragraphs.append(paragraph)
+                temp_tokens += tokens
 
         # Don't forget to add the last batch of paragraphs
-        result.append(temp_paragraphs.strip())
+        result.append('\n'.join(temp_paragraphs).strip())
 
         return result
 
-    def perform_ner_chunk(self, chunk):
+    async def perform_ner_chunk(self, chunk, max_attempts: int = 3):
         prompt = 'extract all named entities in JSON format as an array of objects with "type" and "entity" fields from the text in the user message. Before including each entity, verify that it has not already been included.  Your output should consist of only json.'
-        while True:
+        for attempt in range(max_attempts):
+            js_text, tokens = await self._achat_one_shot(prompt, chunk, 'gpt-4-0613')
             try:
-                js_text, tokens = self._chat_one_shot(prompt, chunk, 'gpt-4-0613')
-                return json.loads(js_text)
-            except:
-                print(f"NER failure retrying\n{js_text}")
+                return orjson.loads(js_text)
+            except orjson.JSONDecodeError as e:
+                logging.warning("NER JSON parse retry %d of %d: %s\n%s", attempt + 1, max_attempts, e, js_text)
+
+        raise ValueError(f"NER response was not valid JSON after {max_attempts} attempts")
 
 
 if __name__ == '__main__':
-    arg_parser = argparse.ArgumentParser(description="Parse an RSS feed and store new entries in a database.")
-    arg_parser.add_argument("url", help="The URL of the RSS feed to parse.")
+    arg_parser = argparse.ArgumentParser(description="Parse one or more RSS feeds and store new entries in a database.")
+    arg_parser.add_argument("urls", nargs="+", help="The URLs of the RSS feeds to parse.")
     args = arg_parser.parse_args()
 
     db = RSSRepo('rss.db')
     # db.delete_all_ner()
 
     processor = FeedProcessor(db)
-    processor.parse_feed(args.url)
+    asyncio.run(processor.parse_feeds(args.urls))
 
     db.close()
@@ -1,6 +1,6 @@
 import sqlite3
 from datetime import datetime
-from feed_entry import FeedEntry
+from feed_entry import FeedEntry, FeedEntryLite
 
 
 class RSSRepo:
@@ -18,8 +18,20 @@ class RSSRepo:
         except sqlite3.Error as e:
             print(f"An error occurred when connecting to the database: {e}")
 
+        self.__configure_connection()
         self.__create_tables()
 
+    def __configure_connection(self):
+        """Tune the connection for an append-heavy workload.
+
+        WAL with synchronous=NORMAL avoids an fsync of the main database file
+        on every commit and allows concurrent readers.
+        """
+        self.cursor.execute('PRAGMA journal_mode=WAL')
+        self.cursor.execute('PRAGMA synchronous=NORMAL')
+        self.cursor.execute('PRAGMA temp_store=MEMORY')
+        self.cursor.execute('PRAGMA cache_size=-65536')
+
     def __create_tables(self):
         """Create the entries, related_links, and related_bios tables in the database if they do not already exist."""
         self.cursor.execute('''
@@ -38,69 +50,111 @@ class RSSRepo:
                    CREATE TABLE IF NOT EXISTS entry_ner
                    (id INTEGER PRIMARY KEY, entry_id INTEGER, entity_type TEXT, entity TEXT, FOREIGN KEY(entry_id) REFERENCES entries(id))
                ''')
+        self.cursor.execute('''
+                   CREATE TABLE IF NOT EXISTS feed_state
+                   (url TEXT PRIMARY KEY, etag TEXT, modified TEXT)
+               ''')
+        self.cursor.execute('''
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_entries_link ON entries(link)
+        ''')
+        self.cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_entry_ner_entry ON entry_ner(entry_id)
+        ''')
 
     def close(self):
         """Close the connection to the database."""
         self.conn.close()
 
-    def have_link(self, url: str):
-        self.cursor.execute('''
-                   SELECT id FROM entries WHERE link = ?
-               ''', (url,))
-
-        return self.cursor.fetchone() is not None
-
     def add_entry(self, title: str, link: str, pub_date: datetime, description: str, subject: str, creator: str, description_tokens: int):
+        """Insert an entry unless its link already exists.
+
+        Returns:
+            The id of the new row, or None when the link is already present.
+        """
         self.cursor.execute('''
-                   INSERT INTO entries (title, link, pubDate, description, dc_subject, dc_creator, description_tokens, summary, summary_tokens)
+                   INSERT OR IGNORE INTO entries (title, link, pubDate, description, dc_subject, dc_creator, description_tokens, summary, summary_tokens)
                    VALUES (?, ?, ?, ?, ?, ?, ?, NULL, 0)
                ''', (title, link, pub_date, description, subject, creator, description_tokens))
 
+        if self.cursor.rowcount == 0:
+            return None
+
         return self.cursor.lastrowid
 
-    def add_related_link(self, entry_id: int, url: str) -> None:
-        """Add a related link to the database.
+    def add_related_links(self, links: list) -> None:
+        """Add a batch of related links to the database.
 
         Args:
-            entry_id: The id of the entry the link is related to.
-            url: The URL of the related link.
+            links: A list of (entry_id, url) tuples.
         """
-        self.cursor.execute('''
+        self.cursor.executemany('''
             INSERT INTO related_links (entry_id, url)
             VALUES (?, ?)
-        ''', (entry_id, url))
+        ''', links)
 
-    def add_related_bio(self, entry_id: int, name: str, url: str) -> None:
-        """Add a related biography to the database.
+    def add_related_bios(self, bios: list) -> None:
+        """Add a batch of related biographies to the database.
 
         Args:
-            entry_id: The id of the entry the bio is related to.
-            name: The name of the person.
-            url: The URL of the biography.
+            bios: A list of (entry_id, name, url) tuples.
         """
-        self.cursor.execute('''
+        self.cursor.executemany('''
             INSERT INTO related_bios (entry_id, name, url)
             VALUES (?, ?, ?)
-        ''', (entry_id, name, url))
+        ''', bios)
 
     def entries_needing_summaries(self):
         self.cursor.execute('''
-             SELECT * FROM entries WHERE summary IS NULL
+             SELECT id, title, link, pubDate, description, description_tokens, dc_subject, dc_creator, summary, summary_tokens
+             FROM entries WHERE summary IS NULL
          ''')
 
         return list(map(lambda row: FeedEntry(*row), self.cursor.fetchall()))
 
     def entries_without_ner(self):
-        """Fetch entries that don't have any related bios."""
+        """Fetch entries that don't have any extracted entities.
+
+        Only the columns NER actually reads are selected, so the potentially
+        large summary text is never pulled off disk.
+        """
         self.cursor.execute('''
-            SELECT entries.* FROM entries 
-            LEFT JOIN entry_ner ON entries.id = entry_ner.entry_id 
+            SELECT entries.id, entries.link, entries.description FROM entries
+            LEFT JOIN entry_ner ON entries.id = entry_ner.entry_id
             WHERE entry_ner.entry_id IS NULL
         ''')
 
-        entries = list(map(lambda row: FeedEntry(*row), self.cursor.fetchall()))
+        entries = list(map(lambda row: FeedEntryLite(*row), self.cursor.fetchall()))
         return entries
 
+    def get_feed_state(self, url: str):
+        """Fetch the stored ETag and Last-Modified values for a feed URL.
+
+        Args:
+            url: The URL of the feed.
+
+        Returns:
+            An (etag, modified) tuple, with None values for unseen feeds.
+        """
+        self.cursor.execute('''
+            SELECT etag, modified FROM feed_state WHERE url = ?
+        ''', (url,))
+
+        row = self.cursor.fetchone()
+        return row if row is not None else (None, None)
+
+    def set_feed_state(self, url: str, etag: str, modified: str) -> None:
+        """Store the ETag and Last-Modified values for a feed URL.
+
+        Args:
+            url: The URL of the feed.
+            etag: The ETag header the server returned, if any.
+            modified: The Last-Modified header the server returned, if any.
+        """
+        self.cursor.execute('''
+            INSERT OR REPLACE INTO feed_state (url, etag, modified)
+            VALUES (?, ?, ?)
+        ''', (url, etag, modified))
+
     def commit(self):
         self.conn.commit()
 
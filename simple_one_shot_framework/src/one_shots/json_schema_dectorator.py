@@ -1,4 +1,5 @@
-from typing import, Callable, Dict, Union
+import types
+from typing import Callable, Dict, Union
 
 
 def json_schema(description: str, params: Dict[str, Dict[str, Union[str, bool]]]) -> Callable:
@@ -44,8 +45,9 @@ def json_schema(description: str, params: Dict[str, Dict[str, Union[str, bool]]]
         if required:
             schema['required'] = required
 
-        # Attach the schema to the original function
-        func.schema = schema
+        # Attach the schema to the original function, read-only so shared
+        # cached copies can't be mutated behind our back
+        func.schema = types.MappingProxyType(schema)
 
         # Return the original function
         return func
@@ -1,22 +1,32 @@
+import asyncio
 import tiktoken
+import functools
 from typing import Any, List
 from chat_response import ChatResponse
 from tool_use_one_shot import ToolUseOneShot
 
 
+@functools.lru_cache(maxsize=None)
+def _get_encoder(model: str):
+    """Return the tiktoken encoder for a model, shared across instances."""
+    return tiktoken.encoding_for_model(model)
+
+
 class TextChunkingOneShot(ToolUseOneShot):
     """TextChunkingOneShot is a subclass of ToolUseOneShot that processes large blocks of text in chunks"""
 
     def __init__(self,  **kwargs: Any) -> None:
         super().__init__(**kwargs)
         self.chunk_size = kwargs.get('chunk_size', 2000)
-        self.encoder = tiktoken.encoding_for_model(self.model_name)
+        self.encoder = _get_encoder(self.model_name)
 
-    def arun(self, input_data, overlap: int = 0):
+    async def arun(self, input_data, overlap: int = 0):
         if isinstance(input_data, ChatResponse):
             input_data = input_data.text
 
-        return await super().arun(self.chunk_paragraphs(input_data, overlap))
+        # Chunk on a worker thread so tokenization doesn't block the event loop
+        chunks = await asyncio.to_thread(self.chunk_paragraphs, input_data, overlap)
+        return await super().arun(chunks)
 
     def chunk_paragraphs(self, text: str, overlap: int = 0) -> List[str]:
         """
@@ -30,29 +40,38 @@ class TextChunkingOneShot(ToolUseOneShot):
         # Split text into paragraphs
         paragraphs = text.split("\n")
 
+        # Tokenize all paragraphs in a single batched call
+        token_counts = [len(ids) for ids in self.encoder.encode_batch(paragraphs)]
+
         # Array to hold result
         result = []
 
-        # Temporary variable to hold paragraphs
+        # Temporary variable to hold paragraphs, with a parallel list of token
+        # counts and a running total so we never re-encode the buffer
         temp_paragraphs = []
+        temp_counts = []
+        temp_tokens = 0
 
-        for paragraph in paragraphs:
-            # Calculate tokens in the current paragraph
-            tokens = len(self.encoder.encode(paragraph))
-
+        for paragraph, tokens in zip(paragraphs, token_counts):
             # If tokens in the current paragraph and the temporary paragraphs exceed the limit
             # add the temporary paragraphs to the result and start a new temporary paragraphs
-            if tokens + sum(len(self.encoder.encode(p)) for p in temp_paragraphs) > self.chunk_size:
+            if tokens + temp_tokens > self.chunk_size:
                 result.append('\n'.join(temp_paragraphs).strip())
 
                 # Remove paragraphs from the start of temp_paragraphs to maintain overlap
                 if overlap < len(temp_paragraphs):
                     temp_paragraphs = temp_paragraphs[-overlap:]
+                    temp_counts = temp_counts[-overlap:]
+                    temp_tokens = sum(temp_counts)
 
                 temp_paragraphs.append(paragraph)
+                temp_counts.append(tokens)
+                temp_tokens += tokens
             else:
                 # Otherwise, add the current paragraph to the temporary paragraphs
                 temp_paragraphs.append(paragraph)
+                temp_counts.append(tokens)
+                temp_tokens += tokens
 
         # Don't forget to add the last batch of paragraphs
         if temp_paragraphs:
@@ -1,4 +1,3 @@
-import copy
 import json
 import openai
 import asyncio
@@ -6,6 +5,7 @@ import inspect
 import logging
 from asyncio import Semaphore
 from typing import Any, Dict, List, Union, Optional
+from tenacity import AsyncRetrying, before_sleep_log, retry_if_exception, stop_after_attempt, wait_random_exponential
 
 from chat_response import ChatResponse
 from simple_one_shot_framework.src.one_shots.chat_response import ChatResponse
@@ -34,12 +34,14 @@ class ToolUseOneShot:
 
     Methods
     -------
-    __exponential_backoff(delay: int)
-        Delays the execution for backoff strategy
     arun(input_data: Union[List, ChatResponse])
         Runs tasks asynchronously and returns the results
     """
 
+    # Process-wide cache of extracted schemas, shared by every instance with
+    # an equivalent toolchest
+    _schema_cache: Dict[tuple, List[Dict[str, Any]]] = {}
+
     def __init__(self, **kwargs) -> None:
         """
         Constructs all the necessary attributes for the ToolUseOneShot object.
@@ -72,16 +74,39 @@ class ToolUseOneShot:
         self.tool_chest['self'] = self
         self.schemas = None
 
-    async def __exponential_backoff(self, delay: int) -> None:
+    @staticmethod
+    def __is_retryable(exc: BaseException) -> bool:
+        """
+        Decides whether a completion error is worth retrying.
+
+        Transient OpenAI errors are retried; invalid requests never succeed
+        on retry and are raised immediately.
+
+        Parameters
+        ----------
+        exc : BaseException
+            The exception raised by the completion call.
+        """
+        return isinstance(exc, openai.error.OpenAIError) and not isinstance(exc, openai.error.InvalidRequestError)
+
+    async def __completion(self, opts: Dict[str, Any]):
         """
-        Delays the execution for backoff strategy.
+        Issues a single ChatCompletion request with jittered retry on transient errors.
+
+        Random-exponential waits desynchronize retries across gathered tasks.
 
         Parameters
         ----------
-        delay : int
-            The delay in seconds.
+        opts : dict
+            The keyword arguments for the completion call.
         """
-        await asyncio.sleep(min(2 * delay, self.max_delay))
+        async for attempt in AsyncRetrying(wait=wait_random_exponential(min=1, max=self.max_delay),
+                                           stop=stop_after_attempt(6),
+                                           retry=retry_if_exception(self.__is_retryable),
+                                           before_sleep=before_sleep_log(logging.getLogger(__name__), logging.WARNING),
+                                           reraise=True):
+            with attempt:
+                return await openai.ChatCompletion.acreate(**opts)
 
     async def arun(self, input_data: Union[str, List[ChatResponse], ChatResponse, List[str]]) -> Union[List[ChatResponse], ChatResponse]:
         """
@@ -141,14 +166,23 @@ class ToolUseOneShot:
         if self.schemas is not None:
             return self.schemas
 
-        self.schemas = []
-        for src_name in self.tool_chest:
-            for name, method in inspect.getmembers(self.tool_chest[src_name], predicate=inspect.ismethod):
-                if hasattr(method, 'schema'):
-                    schema = copy.deepcopy(method.schema)
-                    schema['name'] = f"{src_name}-{schema['name']}"
-                    self.schemas.append(schema)
-
+        # Schemas live on the methods, so two toolchests with the same names and
+        # types yield identical schemas and can share one reflection pass
+        cache_key = tuple(sorted(((name, type(obj)) for name, obj in self.tool_chest.items()), key=lambda item: item[0]))
+        schemas = ToolUseOneShot._schema_cache.get(cache_key)
+        if schemas is None:
+            schemas = []
+            for src_name in self.tool_chest:
+                for name, method in inspect.getmembers(self.tool_chest[src_name], predicate=inspect.ismethod):
+                    if hasattr(method, 'schema'):
+                        # Only the top-level name is rewritten, so a shallow copy is enough
+                        schema = dict(method.schema)
+                        schema['name'] = f"{src_name}-{schema['name']}"
+                        schemas.append(schema)
+
+            ToolUseOneShot._schema_cache[cache_key] = schemas
+
+        self.schemas = schemas
         return self.schemas
 
     async def __call_function(self, function_id: str, function_args: dict):
@@ -186,16 +220,17 @@ class ToolUseOneShot:
 
             messages = self.__construct_message_array(additional_messages, user_message, sys_prompt)
 
+        # opts is built once here and reused across retries; the cached schema
+        # list is shared rather than rebuilt per call
         functions = self.__functions()
         opts = {"model": model_name, "temperature": temperature, "messages": messages}
-        if len(functions):
+        if functions:
             opts['functions'] = functions
 
-        delay = 1  # Initial delay between retries
         async with self.semaphore:
             while True:
                 try:
-                    response = await openai.ChatCompletion.acreate(**opts)
+                    response = await self.__completion(opts)
                     response_message = response["choices"][0]["message"]
                     if response_message.get("function_call"):
                         function_response = await self.__call_function(response_message["function_call"]["name"], json.loads(response_message["function_call"]["arguments"]))
@@ -209,8 +244,7 @@ class ToolUseOneShot:
                     raise
                 except openai.error.OpenAIError as e:
                     logging.exception("OpenAIError occurred: %s", e)
-                    await self.__exponential_backoff(delay)
-                    delay *= 2
+                    raise
                 except Exception as e:
                     logging.exception("Error occurred during chat completion: %s", e)
                     raise